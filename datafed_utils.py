@@ -5,6 +5,7 @@ from multiprocessing import cpu_count
 import joblib
 import datetime
 import json
+import shutil
 from warnings import warn
 from collections import Iterable
 import numpy as np
@@ -15,6 +16,11 @@ if sys.version_info.major == 3:
 
 MAX_ALIAS_LENGTH = 60
 
+SIZE_UNITS = ['bytes', 'kB', 'MB', 'GB', 'TB']
+SIZE_FACTORS = 1024 ** np.arange(len(SIZE_UNITS), dtype=np.int64)
+TIME_UNITS = ['msecs', 'secs', 'mins', 'hours', 'days']
+TIME_FACTORS = np.array([0.001, 1, 60, 3600, 3600 * 24])
+
 # --------------- STUFF STOLEN FROM pyUSID ------------------------------------
 
 
@@ -71,9 +77,147 @@ def format_size(size_in_bytes, decimals=2):
     str
         String with size formatted correctly
     """
-    units = ['bytes', 'kB', 'MB', 'GB', 'TB']
-    factors = 1024 ** np.arange(len(units), dtype=np.int64)
-    return format_quantity(size_in_bytes, units, factors, decimals=decimals)
+    return format_quantity(size_in_bytes, SIZE_UNITS, SIZE_FACTORS,
+                           decimals=decimals)
+
+
+def _unit_indices(values, factors):
+    # Index of the largest factor <= each value. Clipping at 0 handles values
+    # smaller than the smallest factor
+    indices = np.searchsorted(np.asarray(factors), values, side='right') - 1
+    return np.clip(indices, 0, None)
+
+
+def format_quantities(values, unit_names, factors, decimals=2):
+    """
+    Array version of format_quantity() that picks the units for all values at
+    once via a single searchsorted
+    Parameters
+    ----------
+    values : array-like
+        values in some base units. For example - time in seconds
+    unit_names : array-like
+        List of names of units for each scale of the value
+    factors : array-like
+        List of scaling factors for each scale of the value in ascending order
+    decimals : uint, optional. default = 2
+        Number of decimal places to which the values need to be formatted
+    Returns
+    -------
+    list of str
+        Strings with values formatted correctly
+    """
+    if not isinstance(unit_names, Iterable):
+        raise TypeError('unit_names must an Iterable')
+    if not isinstance(factors, Iterable):
+        raise TypeError('factors must be an Iterable')
+    if len(unit_names) != len(factors):
+        raise ValueError('unit_names and factors must be of the same length')
+    values = np.asarray(values).ravel()
+    factors = np.asarray(factors)
+    unit_names = np.asarray(unit_names)
+
+    indices = _unit_indices(values, factors)
+    scaled = np.round(values / factors[indices], decimals)
+
+    return ['{} {}'.format(val, unit)
+            for val, unit in zip(scaled, unit_names[indices])]
+
+
+def format_sizes(sizes_in_bytes, decimals=2):
+    """
+    Formats the provided sizes in bytes to kB, MB, GB, TB etc.
+    Parameters
+    ----------
+    sizes_in_bytes : array-like
+        sizes in bytes
+    decimals : uint, optional. default = 2
+        Number of decimal places to which the sizes need to be formatted
+    Returns
+    -------
+    list of str
+        Strings with sizes formatted correctly
+    """
+    return format_quantities(sizes_in_bytes, SIZE_UNITS, SIZE_FACTORS,
+                             decimals=decimals)
+
+
+def format_times(times_in_sec, decimals=2):
+    """
+    Formats the provided durations in seconds to msec, sec, mins, hours etc.
+    Parameters
+    ----------
+    times_in_sec : array-like
+        durations in seconds
+    decimals : uint, optional. default = 2
+        Number of decimal places to which the durations need to be formatted
+    Returns
+    -------
+    list of str
+        Strings with durations formatted correctly
+    """
+    return format_quantities(times_in_sec, TIME_UNITS, TIME_FACTORS,
+                             decimals=decimals)
+
+
+def summarize_quantities(values, unit_names, factors,
+                         percentiles=(50, 90, 99), decimals=2):
+    """
+    Summarizes the provided quantities for reports
+    Parameters
+    ----------
+    values : array-like
+        values in some base units. For example - sizes in bytes
+    unit_names : array-like
+        List of names of units for each scale of the value
+    factors : array-like
+        List of scaling factors for each scale of the value in ascending order
+    percentiles : array-like, optional. default = (50, 90, 99)
+        Percentiles to report
+    decimals : uint, optional. default = 2
+        Number of decimal places to which the values need to be formatted
+    Returns
+    -------
+    dict
+        "count", formatted "total", "min", "max" and "p<percentile>" values,
+        and "unit_counts" - the number of values falling under each unit
+    """
+    values = np.asarray(values).ravel()
+    summary = {'count': values.size}
+    if values.size == 0:
+        return summary
+
+    stats = [values.sum(), values.min(), values.max()]
+    stats += list(np.percentile(values, percentiles))
+    labels = ['total', 'min', 'max']
+    labels += ['p{}'.format(perc) for perc in percentiles]
+    summary.update(zip(labels, format_quantities(stats, unit_names, factors,
+                                                 decimals=decimals)))
+
+    indices = _unit_indices(values, factors)
+    counts = np.bincount(indices, minlength=len(unit_names))
+    summary['unit_counts'] = dict(zip(unit_names, counts.tolist()))
+    return summary
+
+
+def summarize_sizes(sizes_in_bytes, percentiles=(50, 90, 99), decimals=2):
+    """
+    Summarizes the provided sizes in bytes for collection reports
+    Parameters
+    ----------
+    sizes_in_bytes : array-like
+        sizes in bytes. For example - DataRecord.size of each record
+    percentiles : array-like, optional. default = (50, 90, 99)
+        Percentiles to report
+    decimals : uint, optional. default = 2
+        Number of decimal places to which the sizes need to be formatted
+    Returns
+    -------
+    dict
+        See summarize_quantities()
+    """
+    return summarize_quantities(sizes_in_bytes, SIZE_UNITS, SIZE_FACTORS,
+                                percentiles=percentiles, decimals=decimals)
 
 
 def validate_single_string_arg(value, name):
@@ -220,6 +364,56 @@ def list_items(id_or_alias, offset=None, count=None, project=None,
     return message[0].item, message[0].offset, message[0].total
 
 
+def get_collection_id(id_or_alias):
+    """
+    Resolves the ID ("c/...") of a collection given its ID or alias
+    Parameters
+    ----------
+    id_or_alias : str
+        ID or alias of the collection. For example - 'root'
+    Returns
+    -------
+    str
+        ID of the collection
+    """
+    if id_or_alias.startswith('c/'):
+        return id_or_alias
+    message = df.command('coll view ' + id_or_alias)
+    if message[1] != 'CollDataReply':
+        raise KeyError(message[0].err_msg)
+    return message[0].coll[0].id
+
+
+def list_all_items(id_or_alias, page_size=100, verbose=False):
+    """
+    Generator that pages through all items in a collection via list_items
+    Parameters
+    ----------
+    id_or_alias : str
+        ID or alias of the collection to list
+    page_size : uint, optional. default = 100
+        Number of items requested per listing round trip
+    verbose : bool, optional. default = False
+        Whether or not to print status messages
+    Yields
+    ------
+    ListingReply item
+        Each item in the collection. Collections ("c/") precede records ("d/")
+    """
+    offset = 0
+    total = 1
+    while offset < total:
+        item_list, offset, total = list_items(id_or_alias,
+                                              offset=offset or None,
+                                              count=page_size,
+                                              verbose=verbose)
+        if len(item_list) == 0:
+            break
+        for item in item_list:
+            yield item
+        offset += len(item_list)
+
+
 def get_clean_alias(title):
     for char in '~`!@#$%^&*()+=[{}]|\:,;"<>/?-':
         title = title.replace(char,'_')
@@ -227,6 +421,13 @@ def get_clean_alias(title):
     return title.lower().strip()
 
 
+def get_clean_title(title):
+    for char in '~`!@#$%^&*()+=[{}]|\:,;"<>/?-':
+        title = title.replace(char, '_')
+    title = title.replace(' ', '_')[:MAX_ALIAS_LENGTH]
+    return title.strip()
+
+
 def view_record(alias_or_id, verbose=True): 
          
     com = 'data view ' + alias_or_id
@@ -277,7 +478,11 @@ class DataRecord(object):
         self.title = record_data.title
         self.alias = record_data.alias
         self.repo_id = record_data.repo_id
-        self.metadata = json.loads(record_data.metadata)
+        # Records created without metadata have an empty string
+        if len(record_data.metadata) > 0:
+            self.metadata = json.loads(record_data.metadata)
+        else:
+            self.metadata = dict()
     
     def __repr__(self):
         output = ''
@@ -438,13 +643,7 @@ def create_or_get_collection(name, parent_collection='root',
             offset += len(item_list)
         return all_collections
 
-    def _get_clean_title(title):
-        for char in '~`!@#$%^&*()+=[{}]|\:,;"<>/?-':
-            title = title.replace(char, '_')
-        title = title.replace(' ', '_')[:MAX_ALIAS_LENGTH]
-        return title.strip()
-
-    name = _get_clean_title(name)
+    name = get_clean_title(name)
 
     if avoid_duplicates:
         existing_colls = _list_all_collections(parent_collection)
@@ -647,7 +846,7 @@ def create_datafed_record(h5_path, md_json_path=None, collection=None,
     return put_msg   
 
 
-def check_and_insert(item, verbose=True):
+def check_and_insert(item, verbose=True, collection='root'):
     datafed_init()
     base_name = os.path.split(item)[-1].replace('.h5', '')
     
@@ -659,13 +858,23 @@ def check_and_insert(item, verbose=True):
             return
     
     # if not, put into DataFed
-    message = create_datafed_record(item, check_for_existing=False, verbose=verbose)
+    message = create_datafed_record(item, collection=collection,
+                                    check_for_existing=False, verbose=verbose)
         
     if message is None:
         raise ValueError('Something went wrong')
 
 
-def push_all_datasets_to_datafed(root_dir, parallel=False, verbose=True):
+def push_all_datasets_to_datafed(root_dir, parallel=False, collection='root',
+                                 dry_run=False, verbose=True):
+    # The dry run and the real push must target the same collection
+    if dry_run:
+        plan = plan_datafed_ingest(root_dir, collection=collection,
+                                   verbose=verbose)
+        if verbose:
+            print(plan)
+        return plan
+
     all_files = os.listdir(root_dir)
     
     h5_file_paths = list()
@@ -676,7 +885,7 @@ def push_all_datasets_to_datafed(root_dir, parallel=False, verbose=True):
                 
     func = check_and_insert
     func_args = list()
-    func_kwargs = {'verbose': verbose}
+    func_kwargs = {'collection': collection, 'verbose': verbose}
     if parallel:
         cores = cpu_count()
     else:
@@ -690,12 +899,569 @@ def push_all_datasets_to_datafed(root_dir, parallel=False, verbose=True):
         # print(results)
     else:    
         for item in h5_file_paths:
-            check_and_insert(item)
+            check_and_insert(item, collection=collection)
+
+
+# --------------- DRY-RUN INGEST PLANNING -------------------------------------
+
+# Estimated number of DataFed commands issued when executing each action.
+# "create" checks for an existing alias before creating the record.
+INGEST_ROUND_TRIPS = {'create_collection': 1,
+                      'create': 2,
+                      'update': 1,
+                      'transfer': 1,
+                      'skip': 0}
+
+
+class IngestPlan(object):
+    """
+    Serializable list of actions that push_all_datasets_to_datafed would
+    perform, built by plan_datafed_ingest() and run by execute_ingest_plan()
+    """
+    def __init__(self, root_dir, collection='root', on_existing='skip',
+                 actions=None, collections=None, listing_round_trips=0):
+        self.root_dir = root_dir
+        self.collection = collection
+        self.on_existing = on_existing
+        # Ordered list of dicts - each with an "action" key
+        self.actions = [] if actions is None else actions
+        # Relative directory -> collection ID (None if yet to be created)
+        self.collections = {'.': collection} if collections is None \
+            else collections
+        self.listing_round_trips = listing_round_trips
+
+    def count(self, action):
+        return len([item for item in self.actions
+                    if item['action'] == action])
+
+    @property
+    def total_bytes(self):
+        return sum([item['size'] for item in self.actions
+                    if item['action'] == 'transfer'])
+
+    @property
+    def round_trips(self):
+        return sum([INGEST_ROUND_TRIPS[item['action']]
+                    for item in self.actions])
+
+    def to_dict(self):
+        return {'root_dir': self.root_dir,
+                'collection': self.collection,
+                'on_existing': self.on_existing,
+                'actions': self.actions,
+                'collections': self.collections,
+                'listing_round_trips': self.listing_round_trips}
+
+    @classmethod
+    def from_dict(cls, plan_dict):
+        return cls(**plan_dict)
+
+    def save(self, file_path):
+        with open(file_path, mode='w') as file_handle:
+            json.dump(self.to_dict(), file_handle, indent=4)
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, mode='r') as file_handle:
+            return cls.from_dict(json.load(file_handle))
+
+    def __repr__(self):
+        output = ''
+        output += 'Root directory: \t' + self.root_dir + '\n'
+        output += 'Collection: \t\t' + self.collection + '\n'
+        for action in ['create_collection', 'create', 'update', 'skip',
+                       'transfer']:
+            output += '{}: \t{}\n'.format(action.replace('_', ' ').title(),
+                                           self.count(action))
+        output += 'Transfer size: \t\t' + format_size(self.total_bytes) + '\n'
+        output += 'Est. round trips: \t{}\n'.format(self.round_trips)
+        return output
+
+
+def _dirs_with_h5(root_dir):
+    # Relative paths of directories with h5 files anywhere in their subtree
+    h5_dirs = set()
+    for dir_path, _, file_names in os.walk(root_dir):
+        if not any([item.endswith('.h5') for item in file_names]):
+            continue
+        rel_dir = os.path.relpath(dir_path, root_dir)
+        while rel_dir not in h5_dirs:
+            h5_dirs.add(rel_dir)
+            if rel_dir == '.':
+                break
+            rel_dir = os.path.dirname(rel_dir) or '.'
+    return h5_dirs
+
+
+def plan_datafed_ingest(root_dir, collection='root', recursive=False,
+                        on_existing='skip', check_global_aliases=False,
+                        page_size=100, verbose=True):
+    """
+    Scans root_dir for h5 files (with companion JSON metadata files) and plans
+    the creates, updates, skips, collection creations and transfers needed to
+    put them into DataFed WITHOUT changing anything in DataFed.
+    Existing records and collections are resolved by listing each target
+    collection. Records with the same alias in other collections are only
+    detected if check_global_aliases is set. Otherwise, they are planned as
+    creates and skipped with a warning by execute_ingest_plan()
+    Parameters
+    ----------
+    root_dir : str
+        Path to the local directory containing the h5 files
+    collection : str, optional. default = 'root'
+        ID or alias of the DataFed collection corresponding to root_dir
+    recursive : bool, optional. default = False
+        Whether or not to descend into subdirectories. Each subdirectory
+        containing h5 files is mapped to a child collection of the same title
+    on_existing : str, optional. default = 'skip'
+        What to do with files whose record already exists: 'skip' or 'update'
+        (update metadata and transfer the data again)
+    check_global_aliases : bool, optional. default = False
+        Whether or not to look up each alias not found in the listings, since
+        aliases are unique across all collections. This costs one serial
+        round trip per such file - i.e. every file in a fresh ingest
+    page_size : uint, optional. default = 100
+        Number of items requested per listing round trip
+    verbose : bool, optional. default = True
+        Whether or not to print status messages
+    Returns
+    -------
+    IngestPlan
+        Plan that can be saved, inspected and run via execute_ingest_plan()
+    """
+    if on_existing not in ['skip', 'update']:
+        raise ValueError('on_existing must be either "skip" or "update". '
+                         'Your argument: "{}"'.format(on_existing))
+    root_dir = os.path.abspath(root_dir)
+    if not os.path.isdir(root_dir):
+        raise FileNotFoundError('Provided root_dir is not a directory: ' +
+                                root_dir)
+    datafed_init()
+
+    plan = IngestPlan(root_dir, collection=collection,
+                      on_existing=on_existing)
+    h5_dirs = _dirs_with_h5(root_dir) if recursive else set()
+
+    # Breadth-first so that parent collections are created before children
+    pending = [('.', collection)]
+    while len(pending) > 0:
+        rel_dir, coll_id = pending.pop(0)
+        abs_dir = os.path.normpath(os.path.join(root_dir, rel_dir))
+
+        existing_colls = dict()
+        existing_recs = dict()
+        if coll_id is not None:
+            if verbose:
+                print('Listing existing items in collection: ' + coll_id)
+            num_items = 0
+            for item in list_all_items(coll_id, page_size=page_size):
+                num_items += 1
+                if item.id.startswith('c/'):
+                    existing_colls[item.title] = item.id
+                elif item.id.startswith('d/'):
+                    existing_recs[item.alias] = item.id
+            plan.listing_round_trips += max(1, -(-num_items // page_size))
+
+        for name in sorted(os.listdir(abs_dir)):
+            file_path = os.path.join(abs_dir, name)
+            if not name.endswith('.h5') or not os.path.isfile(file_path):
+                continue
+            title = name[:-3]
+            alias = get_clean_alias(title)
+            md_json_path = None
+            for ext in ['.JSON', '.json']:
+                if os.path.exists(os.path.join(abs_dir, title + ext)):
+                    md_json_path = os.path.join(abs_dir, title + ext)
+                    break
+            rec_id = existing_recs.get(alias, None)
+            if check_global_aliases and rec_id is None and \
+                    md_json_path is not None:
+                # Alias may already be in use in some other collection
+                dat_rec = view_record(alias, verbose=False)
+                plan.listing_round_trips += 1
+                if dat_rec is not None:
+                    rec_id = dat_rec.id
+            action = {'path': file_path, 'title': title, 'alias': alias,
+                      'dir': rel_dir, 'metadata': md_json_path,
+                      'id': rec_id, 'size': os.path.getsize(file_path)}
+
+            if md_json_path is None:
+                reason = 'No JSON file found with same base name'
+            elif rec_id is not None and on_existing == 'skip':
+                reason = 'Record already exists in DataFed'
+            else:
+                reason = None
+
+            if reason is not None:
+                plan.actions.append(dict(action, action='skip',
+                                         reason=reason))
+                continue
+            plan.actions.append(dict(action, action='create' if rec_id is None
+                                     else 'update'))
+            plan.actions.append(dict(action, action='transfer'))
+
+        if not recursive:
+            continue
+
+        for name in sorted(os.listdir(abs_dir)):
+            sub_rel_dir = os.path.normpath(os.path.join(rel_dir, name))
+            if sub_rel_dir not in h5_dirs:
+                continue
+            title = get_clean_title(name)
+            sub_coll_id = existing_colls.get(title, None)
+            if sub_coll_id is None:
+                plan.actions.append({'action': 'create_collection',
+                                     'title': title, 'dir': sub_rel_dir,
+                                     'parent': rel_dir})
+            plan.collections[sub_rel_dir] = sub_coll_id
+            pending.append((sub_rel_dir, sub_coll_id))
+
+    if verbose:
+        print('Planned ingest using {} listing / lookup round trips'
+              ''.format(plan.listing_round_trips))
+
+    return plan
+
+
+def execute_ingest_plan(plan, wait_on_xfr=True, verbose=True):
+    """
+    Performs the actions in a plan from plan_datafed_ingest() in order
+    Parameters
+    ----------
+    plan : IngestPlan or str
+        Plan object or path to a plan saved via IngestPlan.save()
+    wait_on_xfr : bool, optional. default = True
+        Whether or not to wait for each transfer to complete
+    verbose : bool, optional. default = True
+        Whether or not to print status messages
+    Returns
+    -------
+    rec_ids : dict
+        Alias -> record ID for each record that was created or updated
+    skipped : list of dict
+        Actions skipped because DataFed or the files changed since the plan
+        was made, each with a "reason". For example - alias taken elsewhere,
+        record deleted, or file removed. Transfers paired with a skipped
+        create or update are skipped as well
+    """
+    if isinstance(plan, str):
+        plan = IngestPlan.load(plan)
+    if not isinstance(plan, IngestPlan):
+        raise TypeError('plan must be an IngestPlan or path to a saved plan')
+    datafed_init()
+
+    coll_ids = dict(plan.collections)
+    rec_ids = dict()
+    skipped = list()
+
+    def _skip(action, reason):
+        warn('Skipping ' + action['action'] + ' of ' + action['path'] + ': ' +
+             reason)
+        skipped.append(dict(action, reason=reason))
+
+    for action in plan.actions:
+        kind = action['action']
+        if kind == 'create_collection':
+            coll_ids[action['dir']] = create_or_get_collection(
+                action['title'], parent_collection=coll_ids[action['parent']],
+                avoid_duplicates=False, verbose=verbose)
+        elif kind == 'create':
+            try:
+                dat_rec = create_df_record(action['title'],
+                                           alias=action['alias'],
+                                           metadata=action['metadata'],
+                                           collection=coll_ids[action['dir']],
+                                           verbose=verbose)
+            except (KeyError, ValueError, FileNotFoundError) as excep:
+                # Alias was taken or metadata file removed after planning
+                _skip(action, str(excep))
+                continue
+            rec_ids[action['alias']] = dat_rec.id
+        elif kind == 'update':
+            try:
+                data_update(action['id'], metadata=action['metadata'],
+                            verbose=verbose)
+            except (ValueError, FileNotFoundError) as excep:
+                # Record deleted or metadata file removed after planning
+                _skip(action, str(excep))
+                continue
+            rec_ids[action['alias']] = action['id']
+        elif kind == 'transfer':
+            if action['alias'] not in rec_ids:
+                _skip(action, 'Record was not created or updated')
+                continue
+            if not os.path.exists(action['path']):
+                _skip(action, 'File no longer exists')
+                continue
+            if os.path.getsize(action['path']) != action['size']:
+                warn('Size of ' + action['path'] + ' changed since the plan '
+                     'was made')
+            put_df_data(rec_ids[action['alias']], action['path'],
+                        wait=wait_on_xfr, verbose=verbose)
+        elif kind == 'skip':
+            if verbose:
+                print('Skipping ' + action['path'] + ': ' + action['reason'])
+        else:
+            raise ValueError('Unknown action in plan: ' + kind)
+
+    return rec_ids, skipped
+
+# --------------- COLLECTION EXPORT -------------------------------------------
+
+def _flatten_dict(nested, prefix='', sep='.'):
+    flat = dict()
+    for key, val in nested.items():
+        key = prefix + str(key)
+        if isinstance(val, dict):
+            flat.update(_flatten_dict(val, prefix=key + sep, sep=sep))
+        else:
+            flat[key] = val
+    return flat
+
+
+# Columns (and pyarrow types) exported for every record besides metadata
+_EXPORT_COLUMNS = [('id', 'string'),
+                   ('alias', 'string'),
+                   ('title', 'string'),
+                   ('collection', 'string'),
+                   ('owner', 'string'),
+                   ('creator', 'string'),
+                   ('source', 'string'),
+                   ('repo_id', 'string'),
+                   ('size', 'int64'),
+                   ('create_time', 'string'),
+                   ('update_time', 'string'),
+                   ('upload_time', 'string')]
+
+
+def _record_to_row(dat_rec, collection):
+    row = {'id': dat_rec.id,
+           'alias': dat_rec.alias,
+           'title': dat_rec.title,
+           'collection': collection,
+           'owner': dat_rec.owner,
+           'creator': dat_rec.creator,
+           'source': dat_rec.source,
+           'repo_id': dat_rec.repo_id,
+           'size': dat_rec.size,
+           'create_time': dat_rec.create_time.isoformat(),
+           'update_time': dat_rec.update_time.isoformat(),
+           'upload_time': dat_rec.upload_time.isoformat()}
+    row.update(_flatten_dict(dat_rec.metadata, prefix='metadata.'))
+    return row
+
+
+def _view_records_as_rows(id_coll_pairs):
+    datafed_init()
+    rows = list()
+    for rec_id, coll_id in id_coll_pairs:
+        try:
+            dat_rec = view_record(rec_id, verbose=False)
+        except Exception as excep:
+            # One bad record should not stop an entire export
+            warn('Could not view record: ' + rec_id + ' due to: ' +
+                 str(excep) + '. Skipping')
+            continue
+        if dat_rec is None:
+            warn('Could not view record: ' + rec_id + '. Skipping')
+            continue
+        rows.append(_record_to_row(dat_rec, coll_id))
+    return rows
+
+
+def iter_collection_records(id_or_alias, recursive=True, chunk_size=1000,
+                            n_jobs=4, page_size=100, verbose=False):
+    """
+    Generator that walks a collection (tree) and yields its records in chunks
+    of flattened rows. Only one chunk of records is held in memory at a time
+    Parameters
+    ----------
+    id_or_alias : str
+        ID or alias of the collection to export
+    recursive : bool, optional. default = True
+        Whether or not to descend into child collections
+    chunk_size : uint, optional. default = 1000
+        Maximum number of records per yielded chunk
+    n_jobs : uint, optional. default = 4
+        Number of processes fetching record views from DataFed concurrently.
+        Kept small and independent of the number of CPU cores since each
+        process opens its own authenticated DataFed connection
+    page_size : uint, optional. default = 100
+        Number of items requested per listing round trip
+    verbose : bool, optional. default = False
+        Whether or not to print status messages
+    Yields
+    ------
+    list of dict
+        Records with metadata flattened into "metadata.<key>.<sub-key>" columns
+    """
+    def _fetch_chunk(chunk):
+        # The DataFed client is not thread-safe. Each worker process uses its
+        # own client, similar to push_all_datasets_to_datafed
+        batch_size = max(1, -(-len(chunk) // n_jobs))
+        results = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(_view_records_as_rows)(
+                chunk[start_ind: start_ind + batch_size])
+            for start_ind in range(0, len(chunk), batch_size))
+        return [row for rows in results for row in rows]
+
+    # Rows and the visited set only ever hold "c/" IDs, not aliases
+    pending = [get_collection_id(id_or_alias)]
+    visited = set()
+    chunk = list()
+    while len(pending) > 0:
+        coll_id = pending.pop()
+        if coll_id in visited:
+            continue
+        visited.add(coll_id)
+        if verbose:
+            print('Exporting records in collection: ' + coll_id)
+        for item in list_all_items(coll_id, page_size=page_size):
+            if item.id.startswith('c/'):
+                if recursive:
+                    pending.append(item.id)
+            elif item.id.startswith('d/'):
+                chunk.append((item.id, coll_id))
+                if len(chunk) >= chunk_size:
+                    yield _fetch_chunk(chunk)
+                    chunk = list()
+    if len(chunk) > 0:
+        yield _fetch_chunk(chunk)
+
+
+def _path_has_content(path):
+    if os.path.isdir(path):
+        return len(os.listdir(path)) > 0
+    return os.path.exists(path)
+
+
+def _remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _replace_path(src_path, dest_path):
+    # Removing first since os.replace cannot replace a directory
+    _remove_path(dest_path)
+    os.replace(src_path, dest_path)
+
+
+def export_collection(id_or_alias, out_path, file_format=None, recursive=True,
+                      chunk_size=1000, n_jobs=4, page_size=100,
+                      overwrite=False, verbose=True):
+    """
+    Streams the records in a collection (tree) to a JSONL file or to a
+    directory of Parquet files (one file per chunk) without holding the
+    entire collection in memory. All Parquet files share the same schema,
+    with the flattened metadata stored as a JSON string in "metadata".
+    The export is written to out_path + '.tmp' and only moved to out_path
+    once complete, so a failed export never leaves a partial snapshot
+    Parameters
+    ----------
+    id_or_alias : str
+        ID or alias of the collection to export
+    out_path : str
+        Path to the JSONL file or the directory for the Parquet files
+    file_format : str, optional. default = None
+        'jsonl' or 'parquet'. Inferred from the extension of out_path if None
+    recursive : bool, optional. default = True
+        Whether or not to descend into child collections
+    chunk_size : uint, optional. default = 1000
+        Maximum number of records fetched and written at a time
+    n_jobs : uint, optional. default = 4
+        Number of processes fetching record views from DataFed concurrently.
+        Kept small and independent of the number of CPU cores since each
+        process opens its own authenticated DataFed connection
+    page_size : uint, optional. default = 100
+        Number of items requested per listing round trip
+    overwrite : bool, optional. default = False
+        Whether or not to replace an existing file or non-empty directory at
+        out_path
+    verbose : bool, optional. default = True
+        Whether or not to print status messages
+    Returns
+    -------
+    int
+        Number of records exported
+    """
+    if file_format is None:
+        file_format = 'parquet' if out_path.rstrip(os.sep).endswith(
+            '.parquet') else 'jsonl'
+    if file_format not in ['jsonl', 'parquet']:
+        raise ValueError('file_format must be either "jsonl" or "parquet". '
+                         'Your argument: "{}"'.format(file_format))
+    if file_format == 'parquet':
+        try:
+            import pyarrow
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('pyarrow is required for exporting to Parquet. '
+                              'Install via: pip install pyarrow')
+
+    out_path = out_path.rstrip(os.sep)
+    if _path_has_content(out_path) and not overwrite:
+        raise FileExistsError(out_path + ' already exists. Set overwrite=True '
+                              'to replace it')
+    tmp_path = out_path + '.tmp'
+    _remove_path(tmp_path)
+    if file_format == 'parquet':
+        os.makedirs(tmp_path)
+    datafed_init()
+
+    chunks = iter_collection_records(id_or_alias, recursive=recursive,
+                                     chunk_size=chunk_size, n_jobs=n_jobs,
+                                     page_size=page_size, verbose=verbose)
+    num_records = 0
+
+    if file_format == 'jsonl':
+        with open(tmp_path, mode='w') as file_handle:
+            for rows in chunks:
+                for row in rows:
+                    file_handle.write(json.dumps(row) + '\n')
+                num_records += len(rows)
+                if verbose:
+                    print('Exported {} records'.format(num_records))
+        _replace_path(tmp_path, out_path)
+        return num_records
+
+    # Metadata keys and types vary across records. Storing the flattened
+    # metadata as a single JSON string keeps one schema for all part files
+    schema = pyarrow.schema([(name, getattr(pyarrow, arrow_type)())
+                             for name, arrow_type in _EXPORT_COLUMNS] +
+                            [('metadata', pyarrow.string())])
+    prefix = 'metadata.'
+    for chunk_ind, rows in enumerate(chunks):
+        if len(rows) == 0:
+            continue
+        table_rows = list()
+        for row in rows:
+            table_row = {name: row[name] for name, _ in _EXPORT_COLUMNS}
+            table_row['metadata'] = json.dumps(
+                {key[len(prefix):]: val for key, val in row.items()
+                 if key.startswith(prefix)})
+            table_rows.append(table_row)
+        table = pyarrow.Table.from_pylist(table_rows, schema=schema)
+        pq.write_table(table, os.path.join(
+            tmp_path, 'part-{:05d}.parquet'.format(chunk_ind)))
+        num_records += len(rows)
+        if verbose:
+            print('Exported {} records'.format(num_records))
+    _replace_path(tmp_path, out_path)
+    return num_records
 
 
 if __name__ == '__main__':
     datafed_init()
-    if False:
+    if len(sys.argv) > 1 and sys.argv[1] == 'export':
+        # python datafed_utils.py export <collection> <out_path>
+        #                                 [jsonl|parquet] [--overwrite]
+        args = [x for x in sys.argv[2:] if x != '--overwrite']
+        export_collection(args[0], args[1],
+                          file_format=args[2] if len(args) > 2 else None,
+                          overwrite='--overwrite' in sys.argv, verbose=False)
+    elif False:
         message = create_datafed_record(sys.argv[1])
         if message is None:
             raise ValueError('Something went wrong')